@@ -1,11 +1,15 @@
 import logging
 from base import Base
 from decimal import Decimal
-from datetime import timedelta
+from datetime import date, timedelta
 from transaction import Transaction
-from sqlalchemy.orm import relationship, backref, mapped_column
-from sqlalchemy import Integer, String, ForeignKey, Numeric, func
-from exceptions import OverdrawError, TransactionSequenceError, TransactionLimitError
+from sqlalchemy.orm import relationship, backref, mapped_column, reconstructor
+from sqlalchemy import Integer, String, ForeignKey, Numeric, func, insert, event
+from exceptions import NoTransactionsError, OverdrawError, TransactionSequenceError, TransactionLimitError
+
+logger = logging.getLogger(__name__)
+
+_CENT = Decimal('0.01')
 
 class Account(Base):
     """
@@ -34,7 +38,38 @@ class Account(Base):
         """
         self._account_number = account_number
         self._balance = balance
-    
+        self._init_on_load()
+
+    @reconstructor
+    def _init_on_load(self):
+        """
+        Marks the in-memory transaction state as not yet loaded. It is read from the database on first use.
+        """
+        self._cache_loaded = False
+        self._last_date = None
+        self._last_interest_ym = None
+        self._balance_str = None
+
+    def _load_cache(self, session):
+        """
+        Loads the dates of the latest transaction and the latest interest transaction from the database,
+        once per account instance. Afterwards they are kept up to date by add_transaction.
+        """
+        if self._cache_loaded:
+            return
+        # Two separate max() subqueries, so each is a single seek on the (account, date) and (account, is_interest, date) indexes
+        self._last_date, last_interest_date = session.query(
+            session.query(func.max(Transaction._date))
+                .filter(Transaction._account_number == self._account_number)
+                .scalar_subquery(),
+            session.query(func.max(Transaction._date))
+                .filter(Transaction._account_number == self._account_number, Transaction._is_interest == True)
+                .scalar_subquery())\
+            .one()
+        if last_interest_date is not None:
+            self._last_interest_ym = (last_interest_date.year, last_interest_date.month)
+        self._cache_loaded = True
+
     def add_transaction(self, amount, session, transaction_date, bypass_limits=False, is_interest=False):
         """
         Adds a new transaction to the account.
@@ -46,61 +81,131 @@ class Account(Base):
         Returns:
             bool: True if the transaction was successfully added, False otherwise.
         """
-        latest_transaction = session.query(Transaction).filter(Transaction._account_number == self._account_number).order_by(Transaction._date.desc()).first()
-        if latest_transaction and transaction_date < latest_transaction._date:
-            raise TransactionSequenceError(latest_transaction._date)
+        row = self._stage_transaction(amount, session, transaction_date, bypass_limits, is_interest)
+        if row is None:
+            return False
+        # Add the transaction
+        new_transaction = Transaction(amount=row['_amount'], transaction_date=row['_date'], _account_number=self._account_number, is_interest=is_interest)
+        session.add(new_transaction)
+        return True
+
+    def _stage_transaction(self, amount, session, transaction_date, bypass_limits=False, is_interest=False):
+        """
+        Validates a new transaction and applies it to the balance and cached state, without persisting it.
+        Parameters are the same as for add_transaction.
+        Returns:
+            dict: The column values of the new transaction row, or None if it cannot be added.
+        """
+        # Work in whole cents, the precision balances and amounts are stored with
+        amount = (amount if isinstance(amount, Decimal) else Decimal(amount)).quantize(_CENT)
+        if isinstance(transaction_date, str):
+            transaction_date = date.fromisoformat(transaction_date)
+        self._load_cache(session)
+        if self._last_date is not None and transaction_date < self._last_date:
+            raise TransactionSequenceError(self._last_date)
         
         if not bypass_limits:
-            # For SavingsAccount, check transaction limits
-            if isinstance(self, Savings) and not self._can_add_transaction(amount, session, transaction_date):
-                return False
+            # Check transaction limits
+            if not self._check_limits(amount, transaction_date):
+                return None
             # Check for overdraft
-            if self._balance + Decimal(amount) < Decimal('0.00'):
+            if self._balance + amount < 0:
                 raise OverdrawError("This transaction could not be completed due to an insufficient account balance.")
             
-        # Add the transaction
-        new_transaction = Transaction(amount=Decimal(amount), transaction_date=transaction_date, _account_number=self._account_number, is_interest=is_interest)
-        session.add(new_transaction)
+        # Dates never decrease, so the new transaction is always the latest one
+        self._last_date = transaction_date
+        if is_interest:
+            self._last_interest_ym = (transaction_date.year, transaction_date.month)
+        self._record_transaction(transaction_date, is_interest)
         # Update balance
         self._balance += amount
+        self._balance_str = None
+        self._after_balance_update()
+        return {'_amount': amount, '_date': transaction_date, '_is_interest': is_interest, '_account_number': self._account_number}
+
+    @property
+    def account_number_padded(self):
+        """
+        str: The account number zero-padded to 9 digits for display. Account numbers never change, so it is computed once.
+        """
+        padded = self.__dict__.get('_acct_no_str')
+        if padded is None:
+            padded = self.__dict__['_acct_no_str'] = str(self._account_number).zfill(9)
+        return padded
+
+    @property
+    def display_label(self):
+        """
+        str: The account type and padded number for display, e.g. "Checking#000000001". Neither changes, so it is computed once.
+        """
+        label = self.__dict__.get('_display_label')
+        if label is None:
+            label = self.__dict__['_display_label'] = f"{type(self).__name__}#{self.account_number_padded}"
+        return label
+
+    def _formatted_balance(self):
+        """
+        Returns the balance formatted for display, e.g. "1,234.56". The string is cached until the balance changes.
+        """
+        if self._balance_str is None:
+            self._balance_str = f"{self._balance:,.2f}"
+        return self._balance_str
+
+    def _check_limits(self, amount, transaction_date):
+        """
+        Checks if a new transaction can be added without exceeding transaction limits.
+        Accounts have no limits by default; subclasses override this.
+        Returns:
+            bool: True if the transaction can be added, False otherwise.
+        """
         return True
 
+    def _record_transaction(self, transaction_date, is_interest):
+        """
+        Updates any per-account transaction counters after a transaction is added. Does nothing by default.
+        """
+        pass
+
+    def _after_balance_update(self):
+        """
+        Updates any state derived from the balance after it changes. Does nothing by default.
+        """
+        pass
+
     def _get_last_transaction_date(self, session):
         """
         Determines the last transaction date of the month based on existing transactions.
         Returns:
             datetime.date: The last day of the month for the latest transaction.
         """
-        latest_transaction_date = session.query(func.max(Transaction._date)).filter(Transaction._account_number == self._account_number).scalar()
+        self._load_cache(session)
+        latest_transaction_date = self._last_date
         if latest_transaction_date is None:
             # No transactions found, return None 
             return None
         next_month = latest_transaction_date.replace(day=28) + timedelta(days=4)
         return next_month - timedelta(days=next_month.day)
         
-    def _can_apply_interest(self,session):
-       # Query the date of the latest non-interest transaction
-       last_user_transaction_date = session.query(func.max(Transaction._date))\
-            .filter(Transaction._account_number == self._account_number, Transaction._is_interest == False)\
-            .scalar()
-
-        # If there are no non-interest transactions, interest can be applied
-       if not last_user_transaction_date:
-        return True
-       # Query the date of the latest interest transaction
-       last_interest_application_date = session.query(func.max(Transaction._date))\
-            .filter(Transaction._account_number == self._account_number, Transaction._is_interest == True)\
-            .scalar()
-
-        # If there are no interest transactions yet, interest can be applied
-       if not last_interest_application_date:
-           return True
-       # Check if the last non-interest transaction and the last interest application are in the same month and year
-       if (last_user_transaction_date.month == last_interest_application_date.month and 
-           last_user_transaction_date.year == last_interest_application_date.year):
-           return False  # Interest was already applied in the same month of the last transaction
+    def _can_apply_interest(self, session):
+        """
+        Checks that interest has not already been applied in the month of the latest transaction.
+        Returns:
+            bool: True if interest and fees can be applied, False otherwise.
+        """
+        self._load_cache(session)
+        if self._last_date is None or self._last_interest_ym is None:
+            return True
+        return self._last_interest_ym != (self._last_date.year, self._last_date.month)
 
-       return True
+@event.listens_for(Account, "expire", propagate=True)
+def _reset_cache_on_expire(account, attrs):
+    """
+    Drops the cached transaction state whenever the account is expired, e.g. by a commit or rollback.
+    Another process may have added transactions since, so it is reloaded along with the balance.
+    """
+    # The session also expires accounts that were already garbage collected
+    if account is not None:
+        account._init_on_load()
 
 class Savings(Account):
     """
@@ -111,7 +216,31 @@ class Savings(Account):
         'polymorphic_identity':'savings',
     }
 
-    def _can_add_transaction(self, amount, session, transaction_date):
+    _INTEREST_RATE = Decimal('0.0041')
+
+    def _load_cache(self, session):
+        """
+        Also loads the number of non-interest transactions per day and per month, used for the transaction limits.
+        """
+        if self._cache_loaded:
+            return
+        super()._load_cache(session)
+        self._day_counts = {}
+        self._month_counts = {}
+        if self._last_date is None:
+            return
+        # Dates never decrease, so only the latest month can still receive transactions; older months need no counts
+        daily_counts = session.query(Transaction._date, func.count())\
+            .filter(Transaction._account_number == self._account_number,
+                    Transaction._is_interest == False,
+                    Transaction._date >= self._last_date.replace(day=1))\
+            .group_by(Transaction._date)
+        for transaction_date, count in daily_counts:
+            month = (transaction_date.year, transaction_date.month)
+            self._day_counts[transaction_date] = count
+            self._month_counts[month] = self._month_counts.get(month, 0) + count
+
+    def _check_limits(self, amount, transaction_date):
         """
         Checks if a new transaction can be added to the account without exceeding transaction limits.
         Parameters:
@@ -120,31 +249,38 @@ class Savings(Account):
         Returns:
             bool: True if the transaction can be added, False otherwise.
         """
-        same_day_transactions = session.query(func.count(Transaction._id)).filter(Transaction._account_number == self._account_number,
-                                                                          func.date(Transaction._date) == transaction_date,
-                                                                          Transaction._is_interest == False ).scalar()
-        same_month_transactions = session.query(func.count(Transaction._id)).filter(Transaction._account_number == self._account_number,
-                                                                            func.extract('month', Transaction._date) == transaction_date.month,
-                                                                            func.extract('year', Transaction._date) == transaction_date.year,
-                                                                            Transaction._is_interest == False).scalar()
+        same_day_transactions = self._day_counts.get(transaction_date, 0)
+        same_month_transactions = self._month_counts.get((transaction_date.year, transaction_date.month), 0)
         if same_day_transactions >= 2:
             raise TransactionLimitError('daily')
         if same_month_transactions >= 5:
             raise TransactionLimitError('monthly')
         return True
 
+    def _record_transaction(self, transaction_date, is_interest):
+        """
+        Counts a non-interest transaction towards the daily and monthly limits.
+        """
+        if not is_interest:
+            month = (transaction_date.year, transaction_date.month)
+            self._day_counts[transaction_date] = self._day_counts.get(transaction_date, 0) + 1
+            self._month_counts[month] = self._month_counts.get(month, 0) + 1
+
     def apply_interest_and_fees(self, session):
         """
         Applies interest to the account balance and bypasses transaction limits.
         """
+        last_date = self._get_last_transaction_date(session)
+        if last_date is None:
+            # Without transactions there is no month to apply interest and fees to
+            raise NoTransactionsError()
         if not self._can_apply_interest(session):
-            last_interest_date = self._get_last_transaction_date(session)
-            raise TransactionSequenceError(last_interest_date, "Cannot apply interest and fees again in the month of {}.")
+            raise TransactionSequenceError(last_date, "Cannot apply interest and fees again in the month of {}.")
         
-        interest_rate = Decimal('0.0041')
-        interest = self._balance * interest_rate
-        self.add_transaction(interest, session,  self._get_last_transaction_date(session), bypass_limits=True, is_interest=True)
-        logging.debug("Triggered interest and fees")
+        interest = self._balance * self._INTEREST_RATE
+        # Post even when the interest rounds to $0.00: the interest row is what closes the month
+        self.add_transaction(interest, session, last_date, bypass_limits=True, is_interest=True)
+        logger.debug("Triggered interest and fees")
 
 class Checking(Account):
     """
@@ -155,22 +291,44 @@ class Checking(Account):
         'polymorphic_identity':'checking',
     }
 
+    _INTEREST_RATE = Decimal('0.0008')
+    _FEE_THRESHOLD = Decimal('100.00')
+    _FEE = Decimal('5.44')
+
+    def _load_cache(self, session):
+        """
+        Also records whether the loaded balance is below the fee threshold.
+        """
+        if not self._cache_loaded:
+            self._after_balance_update()
+        super()._load_cache(session)
+
+    def _after_balance_update(self):
+        """
+        Records whether the balance is below the fee threshold, so the monthly fee check is a flag read.
+        """
+        self._below_threshold = self._balance < self._FEE_THRESHOLD
+
     def apply_interest_and_fees(self, session):
         """
         Applies interest to the account balance and charges a fee if the balance is below the threshold.
         """
         
+        last_date = self._get_last_transaction_date(session)
+        if last_date is None:
+            # Without transactions there is no month to apply interest and fees to
+            raise NoTransactionsError()
         if not self._can_apply_interest(session):
-            last_interest_date = self._get_last_transaction_date(session)
-            raise TransactionSequenceError(last_interest_date, "Cannot apply interest and fees again in the month of {}.")
-
-        interest_rate = Decimal('0.0008')
-        interest = self._balance * interest_rate
-        self.add_transaction(interest, session, self._get_last_transaction_date(session), bypass_limits=True, is_interest=True)
-        logging.debug("Triggered interest and fees")
-
-        fee_threshold = Decimal('100.00')
-        fee = Decimal('5.44')
-        if self._balance < fee_threshold:
-            self.add_transaction(-fee, session, self._get_last_transaction_date(session), bypass_limits=True, is_interest=True)
+            raise TransactionSequenceError(last_date, "Cannot apply interest and fees again in the month of {}.")
+
+        rows = []
+        interest = self._balance * self._INTEREST_RATE
+        # Post even when the interest rounds to $0.00: the interest row is what closes the month
+        rows.append(self._stage_transaction(interest, session, last_date, bypass_limits=True, is_interest=True))
+        logger.debug("Triggered interest and fees")
+
+        if self._below_threshold:
+            rows.append(self._stage_transaction(-self._FEE, session, last_date, bypass_limits=True, is_interest=True))
+        # Write the interest and the fee with a single INSERT
+        session.execute(insert(Transaction), rows)
 
@@ -1,10 +1,13 @@
 import logging
 from base import Base
-from decimal import Decimal
-from sqlalchemy import Integer
+from sqlalchemy import Integer, func, insert, select, tuple_
+from transaction import Transaction
 from account import Account, Checking, Savings
+from exceptions import AccountNotFoundError
 from sqlalchemy.orm import relationship, backref, mapped_column
 
+logger = logging.getLogger(__name__)
+
 SAVINGS = "savings"
 CHECKING = "checking"
 
@@ -26,8 +29,8 @@ class Bank(Base):
         Returns:
             Account: The newly created account object.
         """
-        last_account = session.query(Account).order_by(Account._account_number.desc()).first()
-        new_account_number = last_account._account_number + 1 if last_account else 1
+        last_account_number = session.query(func.max(Account._account_number)).scalar()
+        new_account_number = (last_account_number or 0) + 1
 
         if account_type == CHECKING:
             account = Checking(new_account_number)
@@ -36,21 +39,80 @@ class Bank(Base):
 
         account._account_number = new_account_number
 
+        self._accounts.append(account)
         session.add(account)
-        logging.debug(f"Created account: {account._account_number}")
+        logger.debug("Created account: %s", account._account_number)
         return account
 
     def summary(self, session):
         """
         Prints a summary of all accounts in the bank.
         """
-        accounts = session.query(Account).all()
-        for account in accounts: 
-            account_type = type(account).__name__
-            account_number = str(account._account_number).zfill(9)
-            balance = account._balance.quantize(Decimal('0.01'))
+        # Stream only the printed columns in batches, without building Account objects
+        rows = session.query(Account._account_type, Account._account_number, Account._balance).yield_per(200)
+        polymorphic_map = Account.__mapper__.polymorphic_map
+        for account_type, account_number, balance in rows:
+            account_type = polymorphic_map[account_type].class_.__name__
+            account_number = str(account_number).zfill(9)
             print(f"{account_type}#{account_number},\tbalance: ${balance:,.2f}")
 
+    def add_transactions(self, entries, session):
+        """
+        Adds a batch of transactions, e.g. from an import, and leaves committing to the caller.
+        Entries are sorted by account number and date first, so they pass the chronological order check
+        and are inserted in the order of the (account number, date) index. Each entry is validated like
+        Account.add_transaction, and only once every entry is accepted are all rows written with a single
+        bulk INSERT. If any entry is rejected, nothing is written and the accounts are left as they were.
+        Parameters:
+            entries (iterable): (account_number, amount, transaction_date) tuples, with dates as datetime.date.
+        Returns:
+            int: The number of transactions added.
+        Raises:
+            AccountNotFoundError: If an entry names an account that does not exist.
+        """
+        # Flush earlier changes first, so undoing a rejected batch only discards this batch
+        session.flush()
+        rows = []
+        touched = []
+        account = None
+        try:
+            # Without autoflush, the lookups for later accounts cannot write an earlier account's staged balance
+            # to the database, where expiring it below would no longer undo it
+            with session.no_autoflush:
+                for account_number, amount, transaction_date in sorted(entries, key=lambda entry: (entry[0], entry[2])):
+                    if account is None or account._account_number != account_number:
+                        account = self.select_account(account_number, session)
+                        if account is None:
+                            raise AccountNotFoundError(account_number)
+                        touched.append(account)
+                    row = account._stage_transaction(amount, session, transaction_date)
+                    if row is not None:
+                        rows.append(row)
+                if rows:
+                    session.execute(insert(Transaction), rows)
+        except Exception:
+            # Drop the staged balances; expiring also resets the cached dates and counters, so they are reloaded
+            for account in touched:
+                session.expire(account)
+            raise
+        return len(rows)
+
+    def apply_monthly_interest(self, session):
+        """
+        Applies interest and fees to every account that is due for them, e.g. for a month-end run.
+        Accounts without transactions, or that already had interest applied this month, are skipped.
+        Returns:
+            list[Account]: The accounts that interest and fees were applied to.
+        """
+        applied = []
+        for account in session.query(Account).all():
+            if account._get_last_transaction_date(session) is None or not account._can_apply_interest(session):
+                continue
+            account.apply_interest_and_fees(session)
+            applied.append(account)
+        logger.debug("Applied monthly interest to %d accounts", len(applied))
+        return applied
+
     def get_account_info(self):
         # If accounts are stored in a dict
         return [(account_number, account) for account_number, account in self._accounts.items()]
@@ -63,19 +125,34 @@ class Bank(Base):
         Returns:
             Account: The account object with the specified account number.
         """
-        account = session.query(Account).filter_by(_account_number=account_number).first()
+        # Primary-key lookup; served from the session's identity map when the account is already loaded
+        account = session.get(Account, account_number)
         return account
 
-    def list_transactions(self, account_number, session):
+    def list_transactions(self, account_number, session, limit=None, after=None, newest_first=False):
         """
-        Retrieves and returns a sorted list of transactions for a specified account.
+        Retrieves the transactions for a specified account, sorted by date.
         Parameters:
             account_number (int): The account number whose transactions are to be retrieved.
+            limit (int): The maximum number of transactions to return, or None for all of them.
+            after (tuple): The (date, id) of the last transaction of the previous page, for fetching a page at a time.
+                Only the transactions that come after it in the requested order are returned, so rows inserted
+                meanwhile do not shift the pages.
+            newest_first (bool): If True, the latest transactions come first.
         Returns:
-            list[Transaction]: A list of transaction objects sorted by date.
+            Iterable[Transaction]: The transaction objects sorted by date. A page is returned as a list;
+                without a limit they are streamed from the database in batches.
         """
-        account = session.query(Account).filter_by(_account_number=account_number).first()
-        # Sort transactions by date
-        if account:
-            sorted_transactions = sorted(account._transactions, key=lambda x: x._date)
-        return sorted_transactions
+        # Let the database sort, using the (account number, date) index
+        if newest_first:
+            order = (Transaction._date.desc(), Transaction._id.desc())
+        else:
+            order = (Transaction._date, Transaction._id)
+        statement = select(Transaction).where(Transaction._account_number == account_number).order_by(*order)
+        if after is not None:
+            key = tuple_(Transaction._date, Transaction._id)
+            statement = statement.where(key < tuple_(*after) if newest_first else key > tuple_(*after))
+        if limit is not None:
+            # A single page is small, so fetch it in one go
+            return session.scalars(statement.limit(limit)).all()
+        return session.scalars(statement.execution_options(yield_per=200))
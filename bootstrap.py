@@ -0,0 +1,53 @@
+import queue
+import atexit
+import logging
+import logging.handlers
+import sqlalchemy
+from base import Base
+# Importing the models registers their tables on Base.metadata
+import bank
+
+def configure_logging(level):
+    """
+    Sends log records to bank.log. Records are queued and written by a background thread,
+    so file I/O stays off the thread handling user input. The queue is drained at exit.
+    Parameters:
+        level (int): The lowest level that is logged, e.g. logging.DEBUG.
+    """
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, logging.FileHandler('bank.log'))
+    logging.basicConfig(handlers=[logging.handlers.QueueHandler(log_queue)], level=level, format='%(asctime)s|%(levelname)s|%(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    listener.start()
+    atexit.register(listener.stop)
+
+def open_database(url="sqlite:///bank.db", **engine_options):
+    """
+    Creates the engine for the bank database and makes sure its schema is up to date.
+    Parameters:
+        url (str): The database URL.
+        engine_options: Further keyword arguments for sqlalchemy.create_engine, e.g. pool settings.
+    Returns:
+        Engine: The engine, with the SQLite settings applied to every new connection.
+    """
+    engine = sqlalchemy.create_engine(url, **engine_options)
+
+    @sqlalchemy.event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL with synchronous=NORMAL makes each commit an append to the log instead of an fsync'd journal rewrite.
+        # busy_timeout lets the CLI and the GUI wait briefly for each other's writes on the same file.
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-20000")
+        cursor.close()
+
+    # Create the schema in one transaction
+    with engine.begin() as connection:
+        Base.metadata.create_all(connection)
+        # create_all skips indexes on tables that already exist, so add any that an older bank.db lacks
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+    return engine
@@ -1,14 +1,37 @@
+import os
 import sys
+import time
+import select
+import signal
+import atexit
 import logging
-import sqlalchemy
 from bank import Bank
-from base import Base
-from datetime import datetime
-from sqlalchemy.orm import sessionmaker
+from datetime import date
+from bootstrap import configure_logging, open_database
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import sessionmaker, selectinload
 from decimal import Decimal, InvalidOperation
-from exceptions import OverdrawError, TransactionSequenceError, TransactionLimitError
+from exceptions import OverdrawError, TransactionSequenceError, TransactionLimitError, NoTransactionsError
 
-logging.basicConfig(filename='bank.log', level=logging.DEBUG, format='%(asctime)s|%(levelname)s|%(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+configure_logging(logging.DEBUG)
+
+logger = logging.getLogger(__name__)
+
+# Pending writes are committed once this many have accumulated, or this many seconds after the last commit.
+# Set BANKCLI_SYNC=1 to commit after every change instead.
+_COMMIT_EVERY_OPS = 50
+_COMMIT_EVERY_SECONDS = 30
+
+# The static part of the menu, formatted once
+_MENU_TAIL = ("Enter command\n"
+              "1: open account\n"
+              "2: summary\n"
+              "3: select account\n"
+              "4: add transaction\n"
+              "5: list transactions\n"
+              "6: interest and fees\n"
+              "7: quit\n"
+              ">")
 
 class BankCLI:
     """
@@ -16,7 +39,7 @@ class BankCLI:
     Attributes:
         bank (Bank): The Bank instance with which this CLI interacts.
         current_account (Account): The account currently selected in the CLI.
-        choices (dict): A dictionary mapping menu options to their corresponding methods.
+        dispatch (tuple): The methods for menu options 1-7, indexed by option number minus one.
     """
 
     def __init__(self):
@@ -24,161 +47,284 @@ class BankCLI:
         Initializes a new BankCLI instance.
         """
         self._session = Session()  # Create a new session
-        self._bank = self._session.query(Bank).first()  # Query the database for the bank state
+        # Query the database for the bank state, loading its accounts in the same pass
+        self._bank = self._session.query(Bank).options(selectinload(Bank._accounts)).first()
         if self._bank:
-            logging.debug("Loaded from bank.db")
+            logger.debug("Loaded from bank.db")
         else:
             # If there's no bank state in the database, create a new one
             self._bank = Bank() 
             self._session.add(self._bank)
             self._session.commit()
+        # Piped input skips input()'s interactive line-editing setup
+        self._interactive = sys.stdin.isatty()
         self._current_account = None
-        self._choices = {
-            "1": self._open_account,
-            "2": self._summary,
-            "3": self._select_account,
-            "4": self._add_transaction,
-            "5": self._list_transactions,
-            "6": self._interest_and_fees,
-            "7": self._quit,
-        }
+        self._current_account_label = None
+        # Writes are committed together at checkpoints rather than after every command
+        self._sync = os.environ.get("BANKCLI_SYNC") == "1"
+        self._uncommitted_ops = 0
+        self._last_commit = time.monotonic()
+        # Set while a command is changing the bank; if an exception stops it part-way, the change is half-applied
+        self._write_in_progress = False
+        # Set by a termination signal; the CLI quits at the next point where no command is running
+        self._stop_requested = False
+        self._waiting_for_input = False
+        atexit.register(self._flush_at_exit)
+        self._dispatch = (
+            self._open_account,
+            self._summary,
+            self._select_account,
+            self._add_transaction,
+            self._list_transactions,
+            self._interest_and_fees,
+            self._quit,
+        )
     def _display_menu(self):
         """
         Displays the main menu of the CLI.
         """
         current_account_display = "None"
         if self._current_account:
-            account_type = type(self._current_account).__name__
-            account_number = str(self._current_account._account_number).zfill(9)
-            balance = self._current_account._balance.quantize(Decimal('0.01'))
-            current_account_display = f"{account_type}#{account_number},\tbalance: ${balance:,.2f}"
-
-        print(f"--------------------------------\n"
-              f"Currently selected account: {current_account_display}\n"
-              f"Enter command\n"
-              f"1: open account\n"
-              f"2: summary\n"
-              f"3: select account\n"
-              f"4: add transaction\n"
-              f"5: list transactions\n"
-              f"6: interest and fees\n"
-              f"7: quit\n"
-              f">", end="")
+            balance = self._current_account._formatted_balance()
+            current_account_display = f"{self._current_account_label},\tbalance: ${balance}"
+
+        sys.stdout.write("--------------------------------\nCurrently selected account: " + current_account_display + "\n" + _MENU_TAIL)
         
     def run(self):
         """
         Runs the main loop of the CLI, processing user input.
         """
-        while True:
-            self._display_menu()
-            choice = input()
-            action = self._choices.get(choice)
-            action()
+        try:
+            while True:
+                if self._stop_requested:
+                    self._quit()
+                self._commit_if_idle()
+                self._display_menu()
+                choice = self._input()
+                # Map "1".."7" straight to a tuple index; anything else is invalid
+                index = ord(choice) - 49 if len(choice) == 1 else -1
+                action = self._dispatch[index] if 0 <= index < len(self._dispatch) else self._invalid
+                action()
+                # The command ran to completion, so none of its changes are half-applied
+                self._write_in_progress = False
+        except (EOFError, KeyboardInterrupt):
+            # End of input (or an interrupt, if SIGINT is not ignored) quits, saving pending changes
+            self._quit()
+
+    def _commit_if_idle(self):
+        """
+        Commits pending writes before waiting for the next command, unless that command is already waiting
+        on stdin and the commit deadline has not passed. An idle CLI must not keep bank.db locked for writing.
+        """
+        if not self._uncommitted_ops:
+            return
+        overdue = time.monotonic() - self._last_commit >= _COMMIT_EVERY_SECONDS
+        if overdue or not self._input_ready():
+            self._flush_dirty()
+
+    def _input_ready(self):
+        """
+        Returns True if stdin can be read without blocking.
+        """
+        try:
+            return bool(select.select([sys.stdin], [], [], 0)[0])
+        except (OSError, ValueError):
+            # stdin cannot be polled here (e.g. on Windows), so assume the read would block
+            return False
+
+    def _input(self, prompt=""):
+        """
+        Writes the prompt and reads one line of user input, without the trailing newline.
+        """
+        self._waiting_for_input = True
+        try:
+            # A signal that arrived just before the flag was set would otherwise wait for the next line
+            if self._stop_requested:
+                self._quit()
+            if self._interactive:
+                return input(prompt)
+            sys.stdout.write(prompt)
+            sys.stdout.flush()
+            line = sys.stdin.readline()
+            if not line:
+                raise EOFError("EOF when reading a line")
+            return line.rstrip("\n")
+        finally:
+            self._waiting_for_input = False
+
+    def _invalid(self):
+        """
+        Reprompts after an unrecognized menu option.
+        """
+        print("Please try again with a number from 1 to 7.")
 
     def _open_account(self):
         """
         Opens a new bank account of the specified type (checking or savings).
         """
-        account_type = input("Type of account? (checking/savings)\n>").lower()
+        account_type = self._input("Type of account? (checking/savings)\n>").lower()
+        self._write_in_progress = True
         account = self._bank.open_account(account_type, self._session)
-        self._session.commit()
-        logging.debug("Saved to bank.db")
+        self._record_write()
         
     def _summary(self):
         """
         Displays a summary of all accounts in the bank.
         """
+        self._flush_dirty()
         self._bank.summary(self._session)
 
     def _select_account(self):
         """
         Selects an account based on the user-input account number.
         """
-        account_number = int(input("Enter account number\n>"))
+        account_number = int(self._input("Enter account number\n>"))
         account = self._bank.select_account(account_number, self._session)
         self._current_account = account
+        if account:
+            self._current_account_label = account.display_label
 
     def _add_transaction(self):
         """
         Adds a transaction to the currently selected account.
         """
+        if self._current_account is None:
+            print("This command requires that you first select an account.")
+            return
 
-        try:
-            while True:
-                try:
-                    amount_str = input("Amount?\n>")
-                    amount = Decimal(amount_str) 
-                    break 
-                except InvalidOperation:
-                    print("Please try again with a valid dollar amount.")
-
-            while True:
-                transaction_date = input("Date? (YYYY-MM-DD)\n>")
-                try:
-                    valid_date = datetime.strptime(transaction_date, "%Y-%m-%d").date()
-                    break
-                except ValueError:
-                    print("Please try again with a valid date in the format YYYY-MM-DD.")
+        while True:
+            try:
+                amount_str = self._input("Amount?\n>")
+                amount = Decimal(amount_str) 
+                break 
+            except InvalidOperation:
+                print("Please try again with a valid dollar amount.")
 
+        while True:
+            transaction_date = self._input("Date? (YYYY-MM-DD)\n>")
             try:
-                self._current_account.add_transaction(amount, self._session, valid_date)
-                self._session.commit()
-                logging.debug("Saved to bank.db")
-            except OverdrawError as overdraw:
-                print(overdraw)
-            except TransactionLimitError as limit_error:
-                print(limit_error)
-            except TransactionSequenceError as sequence_error:
-                print(f"New transactions must be from {sequence_error.latest_date.strftime('%Y-%m-%d')} onward.")
-        except AttributeError:
-            print("This command requires that you first select an account.")
+                valid_date = date.fromisoformat(transaction_date)
+                break
+            except ValueError:
+                print("Please try again with a valid date in the format YYYY-MM-DD.")
 
+        self._write_in_progress = True
+        try:
+            self._current_account.add_transaction(amount, self._session, valid_date)
+            self._record_write()
+        except OverdrawError as overdraw:
+            print(overdraw)
+        except TransactionLimitError as limit_error:
+            print(limit_error)
+        except TransactionSequenceError as sequence_error:
+            print(f"New transactions must be from {sequence_error.latest_date.strftime('%Y-%m-%d')} onward.")
 
     def _list_transactions(self):
         """
         Lists all transactions for the currently selected account.
         """
-
-        try:
-            transactions = self._bank.list_transactions(self._current_account._account_number, self._session)
-            for transaction in transactions:
-                print(f"{transaction._date}, ${transaction._amount:,.2f}")
-        except AttributeError:
+        if self._current_account is None:
             print("This command requires that you first select an account.")
+            return
 
+        self._flush_dirty()
+        transactions = self._bank.list_transactions(self._current_account._account_number, self._session)
+        # Write the output in chunks of lines rather than one write per transaction
+        lines = []
+        for transaction in transactions:
+            lines.append("{}, ${:,.2f}\n".format(transaction._date, transaction._amount))
+            if len(lines) == 1000:
+                sys.stdout.write("".join(lines))
+                lines.clear()
+        sys.stdout.write("".join(lines))
 
     def _interest_and_fees(self):
         """
         Applies interest and fees to the currently selected account.
         """
+        if self._current_account is None:
+            print("This command requires that you first select an account.")
+            return
+
+        self._write_in_progress = True
         try:
             self._current_account.apply_interest_and_fees(self._session)
-            self._session.commit()
-            logging.debug("Saved to bank.db")
-        except AttributeError:
-             print("This command requires that you first select an account.")
-        except TransactionSequenceError as interest_error:
+            self._record_write()
+        except (TransactionSequenceError, NoTransactionsError) as interest_error:
             print(interest_error)
 
+    def _record_write(self):
+        """
+        Counts an uncommitted change and commits once enough changes or time have accumulated.
+        """
+        self._uncommitted_ops += 1
+        if (self._sync or self._uncommitted_ops >= _COMMIT_EVERY_OPS
+                or time.monotonic() - self._last_commit >= _COMMIT_EVERY_SECONDS):
+            self._flush_dirty()
+
+    def _flush_dirty(self):
+        """
+        Commits the changes made since the last commit, if there are any.
+        """
+        if self._uncommitted_ops:
+            self._session.commit()
+            self._uncommitted_ops = 0
+            self._last_commit = time.monotonic()
+            logger.debug("Saved to bank.db")
+
+    def _flush_at_exit(self):
+        """
+        Commits pending writes when the process exits, unless an exception stopped a command part-way or a failed
+        flush left the session unusable. Those pending writes are rolled back instead, so no half-applied change is saved.
+        """
+        if not self._uncommitted_ops:
+            return
+        if self._write_in_progress or not self._session.is_active:
+            self._session.rollback()
+            logger.error("Discarded %d uncommitted changes after an error", self._uncommitted_ops)
+            self._uncommitted_ops = 0
+            return
+        self._flush_dirty()
+
+    def _stop_on_signal(self, signum, frame):
+        """
+        Handles termination and hangup by quitting once no command is running, saving pending changes.
+        Exiting from inside a command could leave it half-applied.
+        """
+        self._stop_requested = True
+        if self._waiting_for_input:
+            # Blocked on a prompt, where no change is in progress: quit now instead of after the next line
+            self._waiting_for_input = False
+            self._quit()
+
     def _quit(self):
         """
         Exits the CLI application.
         """
+        self._flush_dirty()
         sys.exit(0)
 
 if __name__ == "__main__":
 
-    engine = sqlalchemy.create_engine("sqlite:///bank.db")
-    Base.metadata.create_all(engine)
+    # Keep connections open in a pool so menu commands reuse them instead of reopening bank.db
+    engine = open_database(poolclass=QueuePool, pool_size=5, max_overflow=0)
     Session = sessionmaker(engine) 
 
+    # Ignore Ctrl-C at the prompts instead of unwinding out of the CLI; quit with 7 or end of input
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
     try:
-        BankCLI().run()
+        cli = BankCLI()
+        # atexit does not run when the process is killed by a signal, so turn termination and hangup into a quit
+        signal.signal(signal.SIGTERM, cli._stop_on_signal)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, cli._stop_on_signal)
+        cli.run()
     except Exception as e:
         # Extract the exception type and message 
         exception_type = e.__class__.__name__
         exception_message = repr(str(e)).replace('\n', '\\n') 
-        logging.error(f"{exception_type}: {exception_message}")
+        logger.error("%s: %s", exception_type, exception_message)
         # Inform the user
         print("Sorry! Something unexpected happened. Check the logs or contact the developer for assistance.")
         sys.exit(0)
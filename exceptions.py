@@ -2,6 +2,17 @@ class NoAccountSelectedError(Exception):
     """Exception raised when no account is selected."""
     pass
 
+class AccountNotFoundError(Exception):
+    """Exception raised when no account has the given account number."""
+    def __init__(self, account_number):
+        super().__init__("There is no account with number {}.".format(account_number))
+        self.account_number = account_number
+
+class NoTransactionsError(Exception):
+    """Exception raised for applying interest and fees to an account without transactions."""
+    def __init__(self):
+        super().__init__("This command requires that the account has at least one transaction.")
+
 class OverdrawError(Exception):
     """Exception raised for attempts to overdraw an account."""
     pass
@@ -16,13 +27,13 @@ class TransactionSequenceError(Exception):
         super().__init__(message)
         self.latest_date = latest_date
         
+_LIMIT_MESSAGES = {
+    'daily': "This transaction could not be completed because this account already has 2 transactions in this day.",
+    'monthly': "This transaction could not be completed because this account already has 5 transactions in this month.",
+}
+
 class TransactionLimitError(Exception):
     """Exception raised for exceeding transaction limits."""
     def __init__(self, limit_type):
-        if limit_type == 'daily':
-            self.message = "This transaction could not be completed because this account already has 2 transactions in this day."
-        elif limit_type == 'monthly':
-            self.message = "This transaction could not be completed because this account already has 5 transactions in this month."
-        else:
-            self.message = "Transaction limit exceeded."
-        super().__init__(self.message)
+        self.message = _LIMIT_MESSAGES.get(limit_type, "Transaction limit exceeded.")
+        super().__init__(self.message)
\ No newline at end of file
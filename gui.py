@@ -1,18 +1,28 @@
+import re
 import sys
 import logging
-import sqlalchemy
 import tkinter as tk
 from bank import Bank
-from base import Base
 from account import Account
-from datetime import datetime
+from datetime import date
 from tkinter import messagebox
 from tkcalendar import DateEntry
+from sqlalchemy import select
 from sqlalchemy.orm import sessionmaker
+from bootstrap import configure_logging, open_database
 from decimal import Decimal, InvalidOperation
-from exceptions import OverdrawError, TransactionSequenceError, TransactionLimitError, NoAccountSelectedError
+from exceptions import OverdrawError, TransactionSequenceError, TransactionLimitError, NoAccountSelectedError, NoTransactionsError
 
-logging.basicConfig(filename='bank.log', level=logging.DEBUG, format='%(asctime)s|%(levelname)s|%(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+# Transactions are shown newest first, fetching this many more whenever the list is scrolled to the end
+_TX_PAGE = 40
+
+# A dollar amount as it is being typed: optional minus sign, digits, at most two decimal places
+_AMT_RE = re.compile(r'-?\d*(\.\d{0,2})?')
+
+# Only INFO and above are kept; the per-commit debug messages are dropped
+configure_logging(logging.INFO)
+
+logger = logging.getLogger(__name__)
 
 # a callback function that handles exceptions
 def handle_exception(exception, value, traceback):
@@ -21,7 +31,7 @@ def handle_exception(exception, value, traceback):
         "Sorry! Something unexpected happened. Check the logs or contact the developer for assistance."
     )
     exception_message = repr(str(value)).replace('\n', '\\n')
-    logging.error(f"{exception.__name__}: {exception_message}")
+    logger.error("%s: %s", exception.__name__, exception_message)
     sys.exit(0)
 
 class BankGUI:
@@ -55,12 +65,25 @@ class BankGUI:
         self._accounts_frame.pack()
 
         self._selected_account = None
+        self._accounts = {}
+        # Radiobutton and its current label per account number, shared selection variable
+        self._account_widgets = {}
+        self._account_var = tk.StringVar(self._window)
+        self._no_accounts_label = None
+        # (date, amount, id) of the transactions loaded so far per account number, dropped when that account gets a new
+        # transaction. Plain values, so a commit does not expire them and force a reload of each row
+        self._tx_cache = {}
+        # Account numbers whose transactions have all been loaded
+        self._tx_complete = set()
+        # Redraws requested by event handlers, done together in one pass shortly afterwards
+        self._pending_redraw = {'accts': False, 'tx': False}
+        self._redraw_job = None
 
         # Create a new session
         self._session = Session() 
-        self._bank = self._session.query(Bank).first()  # Query the database for the bank state
+        self._bank = self._session.scalars(select(Bank)).first()  # Query the database for the bank state
         if self._bank:
-            logging.debug("Loaded from bank.db")
+            logger.info("Loaded from bank.db")
             self._update_accounts_display()
         else:
             # If there's no bank state in the database, create a new one
@@ -89,53 +112,70 @@ class BankGUI:
         self._cancel_btn.pack(side=tk.LEFT, padx=5)
 
     def _open_account(self):
-        prev_selected_account_id = self._selected_account._account_number if self._selected_account else None
-
         account_type = self._account_type.get().lower()
         if account_type in ["checking", "savings"]:
             account = self._bank.open_account(account_type, self._session)
             self._session.commit()
-            logging.debug("Saved to bank.db")
+            logger.debug("Saved to bank.db")
             messagebox.showinfo("Account Created", f"A new {account_type} account has been created with ID: {account._account_number}")
-            self._update_accounts_display(prev_selected_account_id)
+            self._schedule_redraw(accts=True)
             self._cancel_open_account() # Clear the options after operation
         else:
             messagebox.showwarning("Selection Required", "Please select an account type.")
 
     def _update_accounts_display(self, prev_selected_account_id=None):
-        # Clear previous Checkbuttons
-        for widget in self._accounts_frame.winfo_children():
-            widget.destroy()
-
-        accounts = self._session.query(Account).all()  
-        if accounts:
-            for  account in accounts:
-                balance = account._balance.quantize(Decimal('0.01'))
+        # Show current balances, including changes made by other processes: expire every account so that
+        # this one statement reloads them all
+        self._session.expire_all()
+        accounts = self._session.scalars(select(Account).order_by(Account._account_number)).all()
+        # Keep the loaded accounts by number to find the radio buttons that need patching
+        self._accounts = {account._account_number: account for account in accounts}
+
+        # Patch the existing Radiobuttons instead of rebuilding them: drop removed accounts,
+        # relabel accounts whose balance changed, and add new ones (new numbers sort last)
+        for account_number in self._account_widgets.keys() - self._accounts.keys():
+            self._account_widgets.pop(account_number)[0].destroy()
+        for account in accounts:
+            text = f"{account.display_label},\tbalance: ${account._formatted_balance()}"
+            radio, shown_text = self._account_widgets.get(account._account_number, (None, None))
+            if radio is None:
                 radio = tk.Radiobutton(
                     self._accounts_frame, 
-                    text=f"{type(account).__name__}#{str(account._account_number).zfill(9)},\tbalance: ${balance:,.2f}", 
-                    variable=self._selected_account,
+                    text=text, 
+                    variable=self._account_var,
                     value=str(account._account_number),
                     command=lambda acc=account: self._select_account(acc._account_number)
                     )
                 radio.pack(anchor='w')
+            elif shown_text != text:
+                radio.config(text=text)
+                # The balance changed, possibly through another process, so the cached transactions are stale too
+                self._forget_transactions(account._account_number)
+            self._account_widgets[account._account_number] = (radio, text)
                
-                # reselect previously selected account
-                if str(account._account_number) == str(prev_selected_account_id):
-                    radio.select()
-                    self._selected_account = account 
-        else:
+            # reselect previously selected account
+            if str(account._account_number) == str(prev_selected_account_id):
+                radio.select()
+                self._selected_account = account 
+
+        if accounts:
+            if self._no_accounts_label is not None:
+                self._no_accounts_label.destroy()
+                self._no_accounts_label = None
+        elif self._no_accounts_label is None:
             # Display a message if no accounts are available
-            tk.Label(self._accounts_frame, text="No accounts available").pack()
+            self._no_accounts_label = tk.Label(self._accounts_frame, text="No accounts available")
+            self._no_accounts_label.pack()
 
 
     def _cancel_open_account(self):
         self._account_options_frame.destroy()
     
     def _select_account(self, account_number):
-        account = self._bank.select_account(account_number, self._session)
+        # Served from the session's identity map, without SQL, since the account list loaded every account
+        account = self._session.get(Account, account_number)
         self._selected_account = account
-        self._display_transactions(self._selected_account)
+        self._schedule_redraw(tx=True)
     
     def _add_transaction(self):
         if not self._selected_account:
@@ -190,12 +230,15 @@ class BankGUI:
                 messagebox.showwarning("Invalid Operation Error", "Please try again with a valid dollar amount.")
                 return
         
-        valid_date = datetime.strptime(self._date_entry.get(), "%Y-%m-%d").date()
+        valid_date = date.fromisoformat(self._date_entry.get())
         
+        # Reload the account before changing it, in case another process (e.g. the CLI) wrote to it since
+        self._session.expire(self._selected_account)
         try:
             self._selected_account.add_transaction(amount, self._session, valid_date)
             self._session.commit()
-            logging.debug("Saved to bank.db")
+            logger.debug("Saved to bank.db")
+            self._forget_transactions(self._selected_account._account_number)
         except OverdrawError as overdraw:
             messagebox.showwarning("Overdraw Error", str(overdraw))
         except TransactionLimitError as limit_error:
@@ -204,26 +247,16 @@ class BankGUI:
             messagebox.showwarning("Transaction Sequence Error",
                                    f"New transactions must be from {sequence_error.latest_date.strftime('%Y-%m-%d')} onward.")
 
-        if self._selected_account:
-            self._display_transactions(self._selected_account)
-
         self._transaction_options_frame.destroy()
-        self._update_accounts_display(self._selected_account._account_number)
+        self._schedule_redraw(accts=True, tx=True)
 
     def _cancel_transaction(self):
         self._transaction_options_frame.destroy()
 
     def _validate_amount(self, P):
-        # Check if the entry text is a valid or potentially valid decimal number
-        if P == "" or P == "-":
-            return True
-        try:
-            value = Decimal(P)
-            self._amount_entry.config()
-            return True
-        except InvalidOperation:
-            self._amount_entry.config()
-            return False
+        # Runs on every keystroke, so only check the shape here; _process_transaction parses the Decimal.
+        # Whole-dollar amounts are the common case and need no regex.
+        return P.isdecimal() or _AMT_RE.fullmatch(P) is not None
 
     def _display_transactions(self, account):
         # Clear existing transaction display frame if it exists
@@ -233,30 +266,95 @@ class BankGUI:
         self._transaction_display_frame = tk.Frame(self._window)
         self._transaction_display_frame.pack(pady=10)
 
-        transactions = self._bank.list_transactions(int(account._account_number), self._session)
-
-        for transaction in transactions:
-            color = 'green' if transaction._amount >= 0 else 'red'
-            transaction_text = f"{transaction._date}, ${transaction._amount:,.2f}"
-            tk.Label(self._transaction_display_frame, text=transaction_text, fg=color).pack()
+        # One Text widget with a colour tag per line, rather than one Label per transaction
+        self._transaction_scrollbar = tk.Scrollbar(self._transaction_display_frame)
+        self._transaction_text = tk.Text(self._transaction_display_frame, width=30, height=20, yscrollcommand=self._on_transactions_scrolled)
+        self._transaction_scrollbar.config(command=self._transaction_text.yview)
+        self._transaction_text.tag_config('pos', foreground='green')
+        self._transaction_text.tag_config('neg', foreground='red')
+        self._transaction_text.config(state=tk.DISABLED)
+        self._transaction_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self._transaction_text.pack(side=tk.LEFT)
+        self._transaction_account_number = account._account_number
+
+        transactions = self._tx_cache.get(account._account_number)
+        if transactions is None:
+            self._tx_cache[account._account_number] = []
+            self._load_more_transactions()
+        else:
+            self._insert_transactions(transactions)
+
+    def _insert_transactions(self, transactions):
+        self._transaction_text.config(state=tk.NORMAL)
+        for transaction_date, amount, _ in transactions:
+            self._transaction_text.insert(tk.END, f"{transaction_date}, ${amount:,.2f}\n", 'pos' if amount >= 0 else 'neg')
+        self._transaction_text.config(state=tk.DISABLED)
+
+    def _load_more_transactions(self):
+        # Append the next page of older transactions, keeping the lines already shown
+        account_number = self._transaction_account_number
+        loaded = self._tx_cache.get(account_number)
+        # After a write the cache entry is dropped until _flush_redraws rebuilds the view; don't page the stale one
+        if loaded is None or account_number in self._tx_complete:
+            return
+        # Continue from the oldest row loaded so far, so rows added by other writers don't shift the page
+        after = (loaded[-1][0], loaded[-1][2]) if loaded else None
+        batch = [(transaction._date, transaction._amount, transaction._id)
+                 for transaction in self._bank.list_transactions(account_number, self._session, limit=_TX_PAGE, after=after, newest_first=True)]
+        if len(batch) < _TX_PAGE:
+            self._tx_complete.add(account_number)
+        loaded.extend(batch)
+        self._insert_transactions(batch)
+
+    def _on_transactions_scrolled(self, first, last):
+        self._transaction_scrollbar.set(first, last)
+        # The end of the list is in view, so fetch more
+        if float(last) >= 1.0:
+            self._load_more_transactions()
+
+    def _forget_transactions(self, account_number):
+        self._tx_cache.pop(account_number, None)
+        self._tx_complete.discard(account_number)
 
     def _interest_and_fees(self):
+        if self._selected_account is None:
+            messagebox.showwarning("No account selected", "This command requires that you first select an account.")
+            return
+        # Reload the account before changing it, in case another process (e.g. the CLI) wrote to it since
+        self._session.expire(self._selected_account)
         try:
             self._selected_account.apply_interest_and_fees(self._session)
             self._session.commit()
-            logging.debug("Saved to bank.db")
-        except AttributeError:
-            messagebox.showwarning("No account selected", "This command requires that you first select an account.")
-            return
+            logger.debug("Saved to bank.db")
+            self._forget_transactions(self._selected_account._account_number)
         except TransactionSequenceError as interest_error:
             messagebox.showwarning("Sequence Error", str(interest_error))
-        self._display_transactions(self._selected_account)
-        self._update_accounts_display(self._selected_account._account_number)
+        except NoTransactionsError as interest_error:
+            messagebox.showwarning("No transactions", str(interest_error))
+        self._schedule_redraw(accts=True, tx=True)
+
+    def _schedule_redraw(self, accts=False, tx=False):
+        # Requests made within 50 ms of each other are merged into a single redraw
+        if accts:
+            self._pending_redraw['accts'] = True
+        if tx:
+            self._pending_redraw['tx'] = True
+        if self._redraw_job is None:
+            self._redraw_job = self._window.after(50, self._flush_redraws)
+
+    def _flush_redraws(self):
+        self._redraw_job = None
+        if self._pending_redraw['accts']:
+            prev_selected_account_id = self._selected_account._account_number if self._selected_account else None
+            self._update_accounts_display(prev_selected_account_id)
+        # Also redraw the transactions when the account list just dropped the shown account's cached ones
+        if self._selected_account is not None and (self._pending_redraw['tx'] or self._selected_account._account_number not in self._tx_cache):
+            self._display_transactions(self._selected_account)
+        self._pending_redraw = {'accts': False, 'tx': False}
 
 if __name__ == "__main__":
-    engine = sqlalchemy.create_engine("sqlite:///bank.db")
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(engine) 
+    engine = open_database()
+    Session = sessionmaker(engine)
     BankGUI()
 
 
@@ -0,0 +1,78 @@
+import unittest
+from decimal import Decimal
+from datetime import date
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+from bootstrap import open_database
+from bank import Bank, CHECKING, SAVINGS
+from account import Account
+from transaction import Transaction
+from exceptions import AccountNotFoundError, OverdrawError, TransactionLimitError
+
+class AddTransactionsTest(unittest.TestCase):
+    """
+    Tests for Bank.add_transactions, which validates a whole batch before writing any of it.
+    """
+
+    def setUp(self):
+        self._session = sessionmaker(open_database("sqlite://"))()
+        self._bank = Bank()
+        self._session.add(self._bank)
+        self._bank.open_account(CHECKING, self._session)
+        self._bank.open_account(SAVINGS, self._session)
+        self._session.commit()
+
+    def tearDown(self):
+        self._session.close()
+
+    def _balances(self):
+        return dict(self._session.query(Account._account_number, Account._balance))
+
+    def _transaction_count(self):
+        return self._session.query(func.count(Transaction._id)).scalar()
+
+    def test_adds_all_entries(self):
+        added = self._bank.add_transactions([
+            (2, Decimal("30.00"), date(2024, 1, 3)),
+            (1, Decimal("100.00"), date(2024, 1, 2)),
+            (1, Decimal("-40.00"), date(2024, 1, 5)),
+            (2, Decimal("20.00"), date(2024, 1, 1)),
+        ], self._session)
+        self._session.commit()
+        self.assertEqual(added, 4)
+        self.assertEqual(self._balances(), {1: Decimal("60.00"), 2: Decimal("50.00")})
+        self.assertEqual(self._transaction_count(), 4)
+
+    def test_rejected_entry_for_a_later_account_undoes_earlier_accounts(self):
+        # Account 1 is staged first; the overdraft on account 2 must undo it as well
+        with self.assertRaises(OverdrawError):
+            self._bank.add_transactions([
+                (1, Decimal("100.00"), date(2024, 1, 1)),
+                (2, Decimal("-50.00"), date(2024, 1, 1)),
+            ], self._session)
+        self._session.commit()
+        self.assertEqual(self._balances(), {1: Decimal("0.00"), 2: Decimal("0.00")})
+        self.assertEqual(self._transaction_count(), 0)
+
+    def test_rejected_entry_keeps_cached_limits(self):
+        with self.assertRaises(TransactionLimitError):
+            self._bank.add_transactions([(2, Decimal("1.00"), date(2024, 1, 1))] * 3, self._session)
+        self._session.commit()
+        # The two accepted-then-undone entries must not count towards the daily limit
+        self._bank.add_transactions([(2, Decimal("1.00"), date(2024, 1, 1))] * 2, self._session)
+        self._session.commit()
+        self.assertEqual(self._balances()[2], Decimal("2.00"))
+        self.assertEqual(self._transaction_count(), 2)
+
+    def test_unknown_account(self):
+        with self.assertRaises(AccountNotFoundError):
+            self._bank.add_transactions([
+                (1, Decimal("100.00"), date(2024, 1, 1)),
+                (3, Decimal("5.00"), date(2024, 1, 1)),
+            ], self._session)
+        self._session.commit()
+        self.assertEqual(self._balances()[1], Decimal("0.00"))
+        self.assertEqual(self._transaction_count(), 0)
+
+if __name__ == "__main__":
+    unittest.main()
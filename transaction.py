@@ -1,8 +1,8 @@
 from base import Base
 from decimal import Decimal
-from datetime import datetime, date
+from datetime import date
 from sqlalchemy.orm import  mapped_column
-from sqlalchemy import Integer, Numeric, Date, Boolean, ForeignKey
+from sqlalchemy import Integer, Numeric, Date, Boolean, ForeignKey, Index
 
 class Transaction(Base):
     """
@@ -21,6 +21,11 @@ class Transaction(Base):
     _is_interest = mapped_column(Boolean, default=False, nullable=False)
     _account_number = mapped_column(Integer, ForeignKey('accounts._account_number'))
 
+    __table_args__ = (
+        Index('ix_tx_account_date', '_account_number', '_date'),
+        Index('ix_tx_acct_interest_date', '_account_number', '_is_interest', '_date'),
+    )
+
     def __init__(self, amount, transaction_date, _account_number, is_interest=False):
         """
         Initializes a new Transaction instance.
@@ -29,10 +34,10 @@ class Transaction(Base):
             transaction_date (str or datetime.date, optional): The date of the transaction.
             is_interest (bool, optional): Specifies if the transaction is an interest payment. Defaults to False.
         """
-        self._amount = Decimal(amount)
+        self._amount = amount if isinstance(amount, Decimal) else Decimal(amount)
         if isinstance(transaction_date, str):
             # Parse string to datetime.date object
-            self._date= datetime.strptime(transaction_date, "%Y-%m-%d").date()
+            self._date= date.fromisoformat(transaction_date)
         elif isinstance(transaction_date, date):
             # If it's already a date, just use it 
             self._date= transaction_date